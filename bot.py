@@ -1,19 +1,23 @@
 import asyncio
+import signal
 from datetime import datetime
 from aiogram import Bot, Dispatcher, F
 from aiogram.filters import CommandStart, Command
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, BotCommand
+from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, BotCommand, ChatMemberUpdated
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.fsm.context import FSMContext
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from config import BOT_TOKEN
+from config import BOT_TOKEN, ADMIN_IDS, PROFILE_DEFAULT_SECONDS, PROFILE_MAX_SECONDS
 from db import (
     init_db, get_user_by_tg_id, create_user, update_user_name_and_time,
     create_focus, get_active_focus_for_user, create_checkin_simple,
     get_week_stats_for_user, set_new_focus_for_user, get_users_for_morning,
     mark_morning_sent, get_users_for_evening, get_today_checkin_status,
-    mark_evening_sent, get_streak_for_user,
+    mark_evening_sent, get_streak_for_user, recompute_all_streaks,
+    mark_undeliverable, reactivate_user, get_undeliverable_tg_ids,
 )
+import profiling
 
 import logging
 logging.basicConfig(level=logging.INFO)
@@ -38,6 +42,10 @@ bot = Bot(token=BOT_TOKEN)
 dp = Dispatcher()
 scheduler = AsyncIOScheduler()
 
+dp.update.outer_middleware(profiling.UpdateTraceMiddleware())
+dp.message.middleware(profiling.HandlerNameMiddleware())
+bot.session.middleware(profiling.ApiCallTraceMiddleware())
+
 domain_kb = ReplyKeyboardMarkup(
     keyboard=[[KeyboardButton(text="Работа 💼"), KeyboardButton(text="Здоровье 🧘")],
               [KeyboardButton(text="Быт 🏠"), KeyboardButton(text="Учёба 📚")],
@@ -54,6 +62,28 @@ checkin_manual_kb = ReplyKeyboardMarkup(
     keyboard=[[KeyboardButton(text="Чекин 📋")]],
     resize_keyboard=True)
 
+# tg_id чатов, куда доставка невозможна (заблокировали бота и т.п.).
+# Держим в памяти, чтобы не ходить в БД на каждое входящее сообщение.
+undeliverable_chats = set()
+
+@dp.message.outer_middleware()
+async def reactivate_on_message(handler, event: Message, data):
+    if event.from_user and event.from_user.id in undeliverable_chats:
+        reactivate_user(event.from_user.id)
+        undeliverable_chats.discard(event.from_user.id)
+    return await handler(event, data)
+
+@dp.my_chat_member()
+async def on_my_chat_member(update: ChatMemberUpdated):
+    tg_id = update.chat.id
+    status = update.new_chat_member.status
+    if status == "kicked":
+        mark_undeliverable(tg_id, "blocked")
+        undeliverable_chats.add(tg_id)
+    elif status == "member" and tg_id in undeliverable_chats:
+        reactivate_user(tg_id)
+        undeliverable_chats.discard(tg_id)
+
 @dp.message(Command("help"))
 async def cmd_help(message: Message):
     await message.answer("Команды:\n/start – онбординг\n/focus – сменить фокус\n/week – статистика\n/streak – серия\n")
@@ -265,6 +295,38 @@ async def cmd_reset(message: Message, state: FSMContext):
 
 # ========== ВТОРАЯ ПОЛОВИНА НАЧИНАЕТСЯ ЗДЕСЬ ==========
 
+def classify_delivery_error(error: TelegramAPIError):
+    """Постоянная ошибка доставки -> 'blocked' / 'deactivated' / 'chat_not_found', временная -> None."""
+    text = error.message.lower()
+    if isinstance(error, TelegramForbiddenError):
+        if "deactivated" in text:
+            return "deactivated"
+        # bot was blocked by the user / bot was kicked / bot can't initiate conversation
+        return "blocked"
+    if isinstance(error, TelegramBadRequest) and "chat not found" in text:
+        return "chat_not_found"
+    return None
+
+async def send_reminder(tg_id: int, text: str, **kwargs) -> bool:
+    """send_message для рассылок: ошибка одного чата не прерывает цикл по остальным."""
+    try:
+        try:
+            await bot.send_message(tg_id, text, **kwargs)
+        except TelegramRetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            await bot.send_message(tg_id, text, **kwargs)
+        return True
+    except TelegramAPIError as e:
+        delivery_status = classify_delivery_error(e)
+        if delivery_status:
+            logging.info("Chat %s is undeliverable (%s), excluding from reminders", tg_id, delivery_status)
+            mark_undeliverable(tg_id, delivery_status)
+            undeliverable_chats.add(tg_id)
+        else:
+            logging.warning("Failed to send reminder to %s: %s", tg_id, e)
+        return False
+
+@profiling.traced_job
 async def send_morning_focus():
     now = datetime.now()
     current_time_str = now.strftime("%H:%M")
@@ -286,7 +348,7 @@ async def send_morning_focus():
             to_mark.append(user_id)
             continue
         greeting = f"{name}, новый день — тот же фокус 💡" if name else "Новый день — тот же фокус 💡"
-        await bot.send_message(tg_id, f"{greeting}\n\nСегодня главное:\n«{focus['title']}»")
+        await send_reminder(tg_id, f"{greeting}\n\nСегодня главное:\n«{focus['title']}»")
         to_mark.append(user_id)
     if to_mark:
         mark_morning_sent(to_mark, today_str)
@@ -299,6 +361,7 @@ def get_summary_text(status: str, name: str = None) -> str:
         return f"{prefix}сегодня — сделано частично 🌓"
     return f"{prefix}сегодня — не сделано ❌"
 
+@profiling.traced_job
 async def send_daily_checkins():
     now = datetime.now()
     current_time_str = now.strftime("%H:%M")
@@ -314,10 +377,10 @@ async def send_daily_checkins():
         status = get_today_checkin_status(user_id)
         if status:
             summary = get_summary_text(status, name)
-            await bot.send_message(tg_id, summary)
+            await send_reminder(tg_id, summary)
         else:
             prefix = f"{name}, " if name else ""
-            await bot.send_message(tg_id, f"{prefix}как прошёл день по фокусу?", reply_markup=checkin_kb)
+            await send_reminder(tg_id, f"{prefix}как прошёл день по фокусу?", reply_markup=checkin_kb)
         ids_to_mark.append(user_id)
     if ids_to_mark:
         mark_evening_sent(ids_to_mark, today_str)
@@ -416,6 +479,38 @@ async def cmd_focus(message: Message):
         return
     await message.answer(f"Обновил фокус.\n\nНовый фокус:\n«{new_title}»\n\nПродолжай отмечать дни через кнопку «Чекин 📋».")
 
+@dp.message(Command("profile"))
+async def cmd_profile(message: Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    args = message.text.split(maxsplit=1)
+    arg = args[1].strip() if len(args) > 1 else ""
+    if arg == "stop":
+        base = profiling.stop()
+        if base is None:
+            await message.answer("Профилирование не запущено.")
+            return
+        await message.answer(f"Профилирование остановлено.\nРезультаты: {base}.prof / .txt / .traces.jsonl")
+        return
+    if arg and not arg.isdigit():
+        await message.answer("Формат: /profile [секунды] или /profile stop")
+        return
+    seconds = int(arg) if arg else PROFILE_DEFAULT_SECONDS
+    if seconds < 1:
+        await message.answer("Длительность — не меньше 1 секунды.")
+        return
+    seconds = min(seconds, PROFILE_MAX_SECONDS)
+    if not profiling.start(seconds):
+        await message.answer("Профилирование уже идёт. Остановить: /profile stop")
+        return
+    await message.answer(f"Профилирование включено на {seconds} с.")
+
+def toggle_profiling():
+    if profiling.is_active():
+        profiling.stop()
+    else:
+        profiling.start(min(PROFILE_DEFAULT_SECONDS, PROFILE_MAX_SECONDS))
+
 async def setup_bot_commands():
     commands = [
         BotCommand(command="start", description="Запустить бота / онбординг"),
@@ -428,10 +523,14 @@ async def setup_bot_commands():
 
 async def main():
     init_db()
+    undeliverable_chats.update(get_undeliverable_tg_ids())
     await setup_bot_commands()
     scheduler.add_job(send_morning_focus, "interval", seconds=60)
     scheduler.add_job(send_daily_checkins, "interval", seconds=60)
+    scheduler.add_job(recompute_all_streaks, "cron", hour=3, minute=30)
     scheduler.start()
+    if hasattr(signal, "SIGUSR1"):
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, toggle_profiling)
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
@@ -1,12 +1,28 @@
 import sqlite3
 from config import DB_PATH
+from tracing import traced
+
+# Колонки, появившиеся после первой версии models.sql: (таблица, колонка, определение)
+MIGRATIONS = [
+    ('focuses', 'current_streak', 'INTEGER NOT NULL DEFAULT 0'),
+    ('users', 'delivery_status', 'TEXT'),
+    ('users', 'delivery_failed_at', 'TEXT'),
+]
 
 def init_db():
     with sqlite3.connect(DB_PATH) as db:
+        # WAL: долгие чтения (пересчёт серий) не блокируют запись из бота
+        db.execute("PRAGMA journal_mode=WAL")
+        # Сначала докидываем колонки в старые таблицы: индексы в models.sql на них ссылаются
+        for table, column, definition in MIGRATIONS:
+            columns = {row[1] for row in db.execute(f"PRAGMA table_info({table})")}
+            if columns and column not in columns:
+                db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
         with open('models.sql', 'r', encoding='utf-8') as f:
             db.executescript(f.read())
         db.commit()
 
+@traced
 def get_user_by_tg_id(tg_id: int):
     with sqlite3.connect(DB_PATH) as db:
         db.row_factory = sqlite3.Row
@@ -15,11 +31,13 @@ def get_user_by_tg_id(tg_id: int):
         cursor.close()
         return row
 
+@traced
 def create_user(tg_id: int, name: str = None):
     with sqlite3.connect(DB_PATH) as db:
         db.execute("INSERT OR IGNORE INTO users (tg_id, name) VALUES (?, ?)", (tg_id, name))
         db.commit()
 
+@traced
 def update_user_name_and_time(tg_id: int, name: str, morning_time: str, checkin_time: str, start_date: str, last_morning_sent: str = None, last_checkin_reminder_sent: str = None):
     with sqlite3.connect(DB_PATH) as db:
         db.execute(
@@ -28,6 +46,7 @@ def update_user_name_and_time(tg_id: int, name: str, morning_time: str, checkin_
         )
         db.commit()
 
+@traced
 def create_focus(tg_id: int, title: str, domain: str = None):
     with sqlite3.connect(DB_PATH) as db:
         db.row_factory = sqlite3.Row
@@ -45,6 +64,7 @@ def create_focus(tg_id: int, title: str, domain: str = None):
         db.commit()
         return True
 
+@traced
 def get_active_focus_for_user(tg_id: int):
     with sqlite3.connect(DB_PATH) as db:
         db.row_factory = sqlite3.Row
@@ -56,6 +76,7 @@ def get_active_focus_for_user(tg_id: int):
         cursor.close()
         return row
 
+@traced
 def create_checkin_simple(tg_id: int, status: str):
     with sqlite3.connect(DB_PATH) as db:
         db.row_factory = sqlite3.Row
@@ -83,26 +104,29 @@ def create_checkin_simple(tg_id: int, status: str):
         db.commit()
         return True
 
+@traced
 def get_users_for_checkin(current_time_str: str):
     """current_time_str like '21:30'"""
     with sqlite3.connect(DB_PATH) as db:
         db.row_factory = sqlite3.Row
-        cursor = db.execute("SELECT * FROM users WHERE checkin_time = ?", (current_time_str,))
+        cursor = db.execute("SELECT * FROM users WHERE checkin_time = ? AND delivery_status IS NULL", (current_time_str,))
         rows = cursor.fetchall()
         cursor.close()
         return rows
 
+@traced
 def get_users_for_evening(current_time_str: str, today_str: str):
     with sqlite3.connect(DB_PATH) as db:
         db.row_factory = sqlite3.Row
         cursor = db.execute(
-            "SELECT * FROM users WHERE checkin_time = ? AND (last_checkin_reminder_sent IS NULL OR last_checkin_reminder_sent != ?)",
+            "SELECT * FROM users WHERE checkin_time = ? AND delivery_status IS NULL AND (last_checkin_reminder_sent IS NULL OR last_checkin_reminder_sent != ?)",
             (current_time_str, today_str)
         )
         rows = cursor.fetchall()
         cursor.close()
         return rows
 
+@traced
 def mark_evening_sent(user_ids: list, today_str: str):
     if not user_ids:
         return
@@ -112,17 +136,19 @@ def mark_evening_sent(user_ids: list, today_str: str):
         db.execute(f"UPDATE users SET last_checkin_reminder_sent = ? WHERE id IN ({placeholders})", params)
         db.commit()
 
+@traced
 def get_users_for_morning(current_time_str: str, today_str: str):
     with sqlite3.connect(DB_PATH) as db:
         db.row_factory = sqlite3.Row
         cursor = db.execute(
-            "SELECT * FROM users WHERE morning_time = ? AND (last_morning_sent IS NULL OR last_morning_sent != ?)",
+            "SELECT * FROM users WHERE morning_time = ? AND delivery_status IS NULL AND (last_morning_sent IS NULL OR last_morning_sent != ?)",
             (current_time_str, today_str)
         )
         rows = cursor.fetchall()
         cursor.close()
         return rows
 
+@traced
 def mark_morning_sent(user_ids: list, today_str: str):
     if not user_ids:
         return
@@ -132,6 +158,31 @@ def mark_morning_sent(user_ids: list, today_str: str):
         db.execute(f"UPDATE users SET last_morning_sent = ? WHERE id IN ({placeholders})", params)
         db.commit()
 
+@traced
+def mark_undeliverable(tg_id: int, delivery_status: str):
+    """delivery_status: 'blocked', 'chat_not_found' или 'deactivated'"""
+    with sqlite3.connect(DB_PATH) as db:
+        db.execute(
+            "UPDATE users SET delivery_status = ?, delivery_failed_at = CURRENT_TIMESTAMP WHERE tg_id = ?",
+            (delivery_status, tg_id)
+        )
+        db.commit()
+
+@traced
+def reactivate_user(tg_id: int):
+    with sqlite3.connect(DB_PATH) as db:
+        db.execute("UPDATE users SET delivery_status = NULL, delivery_failed_at = NULL WHERE tg_id = ?", (tg_id,))
+        db.commit()
+
+@traced
+def get_undeliverable_tg_ids():
+    with sqlite3.connect(DB_PATH) as db:
+        cursor = db.execute("SELECT tg_id FROM users WHERE delivery_status IS NOT NULL")
+        rows = cursor.fetchall()
+        cursor.close()
+        return {row[0] for row in rows}
+
+@traced
 def get_week_stats_for_user(tg_id: int):
     with sqlite3.connect(DB_PATH) as db:
         db.row_factory = sqlite3.Row
@@ -209,6 +260,7 @@ def get_week_stats_for_user(tg_id: int):
             'last_7_days': last_7_days_statuses
         }
 
+@traced
 def get_streak_for_user(tg_id: int):
     with sqlite3.connect(DB_PATH) as db:
         db.row_factory = sqlite3.Row
@@ -265,14 +317,16 @@ def get_streak_for_user(tg_id: int):
             'best_streak': best_streak
         }
 
-def get_today_checkin_status(user_id: int):
+@traced
+def get_today_checkin_status(user_id: int, today_str: str = None):
     with sqlite3.connect(DB_PATH) as db:
         db.row_factory = sqlite3.Row
-        cursor = db.execute("SELECT status FROM checkins WHERE user_id = ? AND date = DATE('now') ORDER BY id DESC LIMIT 1", (user_id,))
+        cursor = db.execute("SELECT status FROM checkins WHERE user_id = ? AND date = COALESCE(?, DATE('now')) ORDER BY id DESC LIMIT 1", (user_id, today_str))
         row = cursor.fetchone()
         cursor.close()
         return row['status'] if row else None
 
+@traced
 def set_new_focus_for_user(tg_id: int, title: str, domain: str = None):
     with sqlite3.connect(DB_PATH) as db:
         db.row_factory = sqlite3.Row
@@ -288,4 +342,68 @@ def set_new_focus_for_user(tg_id: int, title: str, domain: str = None):
         db.execute("UPDATE focuses SET is_active = 0, ended_at = CURRENT_TIMESTAMP WHERE user_id = ? AND is_active = 1", (user_id,))
         db.execute("INSERT INTO focuses (user_id, title, domain, is_active) VALUES (?, ?, ?, 1)", (user_id, title, domain))
         db.commit()
-        return True
\ No newline at end of file
+        return True
+
+# Gaps-and-islands: у подряд идущих дней done/partial разность
+# julianday(date) - ROW_NUMBER() постоянна, по ней и группируем серии.
+# Из нескольких чекинов за день берётся последний (MAX(id) с "голыми" колонками в SQLite).
+# Текущая серия — та, что заканчивается последним чекином фокуса (как в get_streak_for_user).
+# Считаем и пишем одним UPDATE на диапазон id фокусов: каждая пачка видит свежие данные,
+# и значение, поднятое ботом после начала пересчёта, не перезаписывается старым.
+# current_streak — снимок на момент пересчёта для массовых выборок; /week и /streak
+# по-прежнему считают серию сами, потому что снимок не видит сегодняшних чекинов.
+STREAKS_UPDATE = """
+WITH days AS (
+    SELECT focus_id, date, status, MAX(id)
+    FROM checkins
+    WHERE focus_id BETWEEN :lo AND :hi
+    GROUP BY focus_id, date
+),
+runs AS (
+    SELECT focus_id, COUNT(*) AS len, MAX(date) AS end_date
+    FROM (
+        SELECT focus_id, date,
+               julianday(date) - ROW_NUMBER() OVER (PARTITION BY focus_id ORDER BY date) AS grp
+        FROM days
+        WHERE status IN ('done', 'partial')
+    )
+    GROUP BY focus_id, grp
+),
+last_day AS (
+    SELECT focus_id, MAX(date) AS last_date
+    FROM checkins
+    WHERE focus_id BETWEEN :lo AND :hi
+    GROUP BY focus_id
+),
+streaks AS (
+    SELECT f.id AS focus_id,
+           COALESCE(MAX(CASE WHEN r.end_date = l.last_date THEN r.len END), 0) AS current_streak,
+           COALESCE(MAX(r.len), 0) AS best_streak
+    FROM focuses f
+    LEFT JOIN last_day l ON l.focus_id = f.id
+    LEFT JOIN runs r ON r.focus_id = f.id
+    WHERE f.id BETWEEN :lo AND :hi
+    GROUP BY f.id
+)
+UPDATE focuses
+SET current_streak = streaks.current_streak, best_streak = streaks.best_streak
+FROM streaks
+WHERE focuses.id = streaks.focus_id
+  AND (focuses.current_streak != streaks.current_streak OR focuses.best_streak != streaks.best_streak)
+"""
+
+@traced
+def recompute_all_streaks(batch_size: int = 1000):
+    """Пересчитывает current_streak и best_streak всех фокусов. Возвращает число обновлённых строк."""
+    with sqlite3.connect(DB_PATH) as db:
+        max_id = db.execute("SELECT MAX(id) FROM focuses").fetchone()[0] or 0
+
+        updated = 0
+        # Короткие транзакции: между пачками бот успевает записать свои чекины
+        for lo in range(1, max_id + 1, batch_size):
+            # rowcount для UPDATE с WITH в sqlite3 не заполняется, считаем по total_changes
+            before = db.total_changes
+            db.execute(STREAKS_UPDATE, {'lo': lo, 'hi': lo + batch_size - 1})
+            updated += db.total_changes - before
+            db.commit()
+    return updated
@@ -7,7 +7,9 @@ CREATE TABLE IF NOT EXISTS users (
     created_at TEXT DEFAULT CURRENT_TIMESTAMP,
     last_morning_sent DATE,
     last_checkin_reminder_sent DATE,
-    start_date DATE
+    start_date DATE,
+    delivery_status TEXT,
+    delivery_failed_at TEXT
 );
 
 CREATE TABLE IF NOT EXISTS focuses (
@@ -19,6 +21,7 @@ CREATE TABLE IF NOT EXISTS focuses (
     ended_at TEXT,
     is_active INTEGER DEFAULT 1,
     best_streak INTEGER NOT NULL DEFAULT 0,
+    current_streak INTEGER NOT NULL DEFAULT 0,
     FOREIGN KEY (user_id) REFERENCES users(id)
 );
 
@@ -33,3 +36,13 @@ CREATE TABLE IF NOT EXISTS checkins (
     FOREIGN KEY (user_id) REFERENCES users(id),
     FOREIGN KEY (focus_id) REFERENCES focuses(id)
 );
+
+CREATE INDEX IF NOT EXISTS idx_checkins_focus_date ON checkins (focus_id, date, status);
+
+-- Поиск на каждого получателя рассылки: активный фокус и сегодняшний чекин
+CREATE INDEX IF NOT EXISTS idx_focuses_user_active ON focuses (user_id, is_active);
+CREATE INDEX IF NOT EXISTS idx_checkins_user_date ON checkins (user_id, date);
+
+-- Рассылки выбирают только доступные чаты (delivery_status IS NULL)
+CREATE INDEX IF NOT EXISTS idx_users_morning_active ON users (morning_time) WHERE delivery_status IS NULL;
+CREATE INDEX IF NOT EXISTS idx_users_checkin_active ON users (checkin_time) WHERE delivery_status IS NULL;
@@ -0,0 +1,123 @@
+import asyncio
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import time
+from datetime import datetime
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from config import PROFILE_DIR
+import tracing
+from tracing import traced, traced_job
+
+logger = logging.getLogger(__name__)
+
+_profiler = None
+_started_at = None
+_stop_handle = None
+
+def is_active() -> bool:
+    return tracing.is_active()
+
+def start(seconds: int) -> bool:
+    """Включает cProfile и сбор трассировок на seconds секунд. False, если уже включено."""
+    global _profiler, _started_at, _stop_handle
+    if tracing.is_active():
+        return False
+    _started_at = datetime.now()
+    _profiler = cProfile.Profile()
+    _profiler.enable()
+    tracing.enable()
+    _stop_handle = asyncio.get_running_loop().call_later(seconds, stop)
+    logger.info("Profiling started for %s s", seconds)
+    return True
+
+def stop():
+    """Выключает профилирование и сохраняет результат. Возвращает базовый путь файлов или None."""
+    global _profiler, _stop_handle
+    if not tracing.is_active():
+        return None
+    traces, dropped = tracing.disable()
+    _profiler.disable()
+    if _stop_handle is not None:
+        _stop_handle.cancel()
+        _stop_handle = None
+    try:
+        base = _dump(_profiler, traces, dropped)
+    except OSError:
+        logger.exception("Failed to write profiling results")
+        base = None
+    _profiler = None
+    return base
+
+def _output_base() -> str:
+    # Миллисекунды в имени плюс счётчик: две сессии подряд не перезапишут друг друга
+    stamp = _started_at.strftime("%Y%m%d-%H%M%S-") + f"{_started_at.microsecond // 1000:03d}"
+    base = os.path.join(PROFILE_DIR, "profile-" + stamp)
+    candidate, n = base, 1
+    while os.path.exists(candidate + ".prof"):
+        candidate = f"{base}-{n}"
+        n += 1
+    return candidate
+
+def _dump(profiler: cProfile.Profile, traces: list, dropped: int) -> str:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = _output_base()
+    profiler.dump_stats(base + ".prof")
+
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats("cumulative").print_stats(50)
+    with open(base + ".txt", "w", encoding="utf-8") as f:
+        f.write(out.getvalue())
+
+    with open(base + ".traces.jsonl", "w", encoding="utf-8") as f:
+        for trace in traces:
+            f.write(json.dumps(trace, ensure_ascii=False) + "\n")
+
+    logger.info("Profiling results saved to %s.* (%s traces, %s dropped)", base, len(traces), dropped)
+    return base
+
+class UpdateTraceMiddleware(BaseMiddleware):
+    """Outer-middleware на dp.update: открывает трассировку на каждый апдейт."""
+
+    async def __call__(self, handler, event, data):
+        if not tracing.is_active():
+            return await handler(event, data)
+        trace, token = tracing.open_trace("update", event.update_id)
+        if trace is None:
+            return await handler(event, data)
+        t0 = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            tracing.close_trace(trace, token, t0)
+
+class HandlerNameMiddleware(BaseMiddleware):
+    """Inner-middleware на dp.message: записывает в трассировку имя выбранного хендлера."""
+
+    async def __call__(self, handler, event, data):
+        if tracing.is_active():
+            trace = tracing.current_trace()
+            handler_object = data.get("handler")
+            if trace is not None and handler_object is not None:
+                trace["handler"] = handler_object.callback.__name__
+        return await handler(event, data)
+
+class ApiCallTraceMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: время каждого запроса к Telegram API (send_message и т.д.)."""
+
+    async def __call__(self, make_request, bot, method):
+        if not tracing.is_active():
+            return await make_request(bot, method)
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            result = await make_request(bot, method)
+            ok = True
+            return result
+        finally:
+            tracing.record_call("api", type(method).__name__, t0, ok)
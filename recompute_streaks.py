@@ -0,0 +1,19 @@
+import argparse
+import logging
+import time
+from db import init_db, recompute_all_streaks
+
+logging.basicConfig(level=logging.INFO)
+
+def main():
+    parser = argparse.ArgumentParser(description="Пересчёт текущих и лучших серий для всех фокусов")
+    parser.add_argument("--batch-size", type=int, default=1000, help="id фокусов на одну транзакцию записи")
+    args = parser.parse_args()
+
+    init_db()
+    t0 = time.perf_counter()
+    updated = recompute_all_streaks(batch_size=args.batch_size)
+    logging.info("Streaks recomputed: %s focuses updated in %.2f s", updated, time.perf_counter() - t0)
+
+if __name__ == "__main__":
+    main()
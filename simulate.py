@@ -0,0 +1,256 @@
+"""Прогон send_morning_focus / send_daily_checkins на виртуальных часах.
+
+Поминутно, как AsyncIOScheduler (интервал 60 с, max_instances=1: пока прошлый
+запуск задачи не закончился, очередной тик пропускается). Запуск из корня репозитория:
+    python simulate.py --users 50000 --days 30 --latency-ms 35
+
+Задержка Telegram виртуальная, а вызовы db.py выполняются по-настоящему: время
+прогона — это работа самого бота с БД (по соединению sqlite на каждый вызов, несколько
+вызовов на получателя). Оно растёт линейно по users * days: ~5 с на виртуальный день
+при 10k пользователей, ~27 с при 50k, то есть месяц на 50k — около 15 минут.
+Секунды на виртуальный день выводятся в отчёте: если они растут от первого дня
+к последнему, какой-то запрос бота масштабируется с размером таблиц.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from aiogram.exceptions import TelegramForbiddenError
+
+MORNING_JOB = "morning"
+EVENING_JOB = "evening"
+CHECKIN_TIME_OF_DAY = "12:00"
+
+class VirtualClock:
+    def __init__(self, start: datetime):
+        self.now = start
+
+    def today_str(self) -> str:
+        return self.now.strftime("%Y-%m-%d")
+
+def make_virtual_datetime(clock: VirtualClock):
+    class VirtualDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return clock.now
+    return VirtualDatetime
+
+class FakeBot:
+    """Записывает вызовы send_message; задержка копится виртуально, без sleep."""
+
+    def __init__(self, clock: VirtualClock, latency_ms: float, jitter_ms: float, rng: random.Random, blocked: set):
+        self.clock = clock
+        self.blocked = blocked
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rng = rng
+        self.job = None
+        self.job_started = None
+        self.job_started_real = 0.0
+        self.latency_s = 0.0
+        self.sent = defaultdict(Counter)
+        self.blocked_attempts = Counter()
+        self.per_minute = Counter()
+
+    async def send_message(self, chat_id: int, text: str, **kwargs):
+        self.latency_s += max(0.0, self.rng.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        if chat_id in self.blocked:
+            self.blocked_attempts[self.job] += 1
+            raise TelegramForbiddenError(method=None, message="Forbidden: bot was blocked by the user")
+        self.sent[self.job][chat_id] += 1
+        self.per_minute[(self.job, self.send_time().strftime("%H:%M"))] += 1
+
+    def send_time(self) -> datetime:
+        # Время начала запуска + реально потраченное (БД, Python) + накопленная задержка отправок
+        elapsed = time.perf_counter() - self.job_started_real + self.latency_s
+        return self.job_started + timedelta(seconds=elapsed)
+
+class DbTimer:
+    def __init__(self):
+        self.total = Counter()
+        self.calls = Counter()
+
+    def wrap(self, fn):
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.total[fn.__name__] += time.perf_counter() - t0
+                self.calls[fn.__name__] += 1
+        return wrapper
+
+def random_time(rng: random.Random, clustered: str, share: float, first_hour: int, last_hour: int) -> str:
+    if rng.random() < share:
+        return clustered
+    return f"{rng.randint(first_hour, last_hour):02d}:{rng.randint(0, 59):02d}"
+
+def seed_users(db_path: str, users: int, share: float, rng: random.Random):
+    rows = []
+    for i in range(1, users + 1):
+        morning = random_time(rng, "08:00", share, 6, 11)
+        evening = random_time(rng, "21:00", share, 18, 23)
+        rows.append((i, 1_000_000 + i, f"user{i}", morning, evening))
+    with sqlite3.connect(db_path) as db:
+        db.executemany("INSERT INTO users (id, tg_id, name, morning_time, checkin_time) VALUES (?, ?, ?, ?, ?)", rows)
+        db.executemany("INSERT INTO focuses (user_id, title, domain, is_active) VALUES (?, ?, ?, 1)",
+                       [(r[0], "Зарядка по утрам", "Здоровье 🧘") for r in rows])
+        db.commit()
+    return {r[0]: (r[1], r[3], r[4]) for r in rows}
+
+def seed_checkins(db_path: str, user_ids: list, today_str: str, rng: random.Random):
+    statuses = ("done", "partial", "fail")
+    with sqlite3.connect(db_path) as db:
+        db.executemany("INSERT INTO checkins (user_id, focus_id, date, status) VALUES (?, ?, ?, ?)",
+                       [(uid, uid, today_str, rng.choice(statuses)) for uid in user_ids])
+        db.commit()
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+async def simulate(args):
+    rng = random.Random(args.seed)
+    # Модули бота читают DB_PATH и BOT_TOKEN при импорте
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="discipline-sim-"), "sim.db")
+    os.environ["DB_PATH"] = db_path
+    os.environ.setdefault("BOT_TOKEN", "123456:simulation-token")
+
+    import db
+    import bot as app
+    # bot.py включает INFO; в симуляции построчные логи рассылки только мешают
+    logging.getLogger().setLevel(logging.WARNING)
+
+    db.init_db()
+    users = seed_users(db_path, args.users, args.cluster_share, rng)
+    blocked = {tg_id for tg_id, _, _ in users.values() if rng.random() < args.blocked_share}
+
+    start = datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time())
+    clock = VirtualClock(start)
+    fake_bot = FakeBot(clock, args.latency_ms, args.jitter_ms, rng, blocked)
+    timer = DbTimer()
+
+    app.bot = fake_bot
+    app.datetime = make_virtual_datetime(clock)
+    for name in ("get_users_for_morning", "mark_morning_sent", "get_users_for_evening",
+                 "mark_evening_sent", "get_active_focus_for_user", "mark_undeliverable"):
+        setattr(app, name, timer.wrap(getattr(app, name)))
+    get_status = timer.wrap(db.get_today_checkin_status)
+    app.get_today_checkin_status = lambda user_id: get_status(user_id, clock.today_str())
+
+    jobs = {MORNING_JOB: app.send_morning_focus, EVENING_JOB: app.send_daily_checkins}
+    busy_until = {job: start for job in jobs}
+    # Обе задачи крутятся в одном event loop: синхронные вызовы sqlite и Python
+    # выполняются по очереди, а ожидание ответа Telegram у задач перекрывается.
+    loop_free_at = start
+    loop_delays = defaultdict(list)
+    day_walls = []
+    tick_durations = defaultdict(list)
+    skipped = Counter()
+    missed = Counter()
+    duplicated = Counter()
+
+    wall_start = time.perf_counter()
+    for day in range(args.days):
+        day_wall_start = time.perf_counter()
+        day_start = start + timedelta(days=day)
+        today_str = day_start.strftime("%Y-%m-%d")
+        checked_in = set()
+        fake_bot.sent.clear()
+
+        for minute in range(24 * 60):
+            tick = day_start + timedelta(minutes=minute)
+            clock.now = tick
+            if tick.strftime("%H:%M") == CHECKIN_TIME_OF_DAY:
+                checked_in = {uid for uid in users if rng.random() < args.checkin_rate}
+                seed_checkins(db_path, list(checked_in), today_str, rng)
+
+            for job, fn in jobs.items():
+                if busy_until[job] > tick:
+                    skipped[job] += 1
+                    continue
+                # Пока loop занят другой задачей, запуск откладывается (и видит уже следующую минуту)
+                job_start = max(tick, loop_free_at)
+                loop_delays[job].append((job_start - tick).total_seconds())
+                clock.now = job_start
+                fake_bot.job = job
+                fake_bot.job_started = job_start
+                fake_bot.latency_s = 0.0
+                t0 = time.perf_counter()
+                fake_bot.job_started_real = t0
+                await fn()
+                cpu = time.perf_counter() - t0
+                loop_free_at = job_start + timedelta(seconds=cpu)
+                job_end = job_start + timedelta(seconds=cpu + fake_bot.latency_s)
+                tick_durations[job].append((job_end - tick).total_seconds())
+                busy_until[job] = job_end
+
+        # Утром пишем всем, кроме тех, кто успел отметиться до своего времени
+        for uid, (tg_id, morning, evening) in users.items():
+            if tg_id in blocked:
+                continue
+            expected = {
+                MORNING_JOB: 0 if (uid in checked_in and morning >= CHECKIN_TIME_OF_DAY) else 1,
+                EVENING_JOB: 1,
+            }
+            for job, count in expected.items():
+                got = fake_bot.sent[job][tg_id]
+                missed[job] += max(0, count - got)
+                duplicated[job] += max(0, got - count)
+        day_walls.append(time.perf_counter() - day_wall_start)
+
+    wall = time.perf_counter() - wall_start
+    report(args, wall, day_walls, fake_bot, tick_durations, loop_delays, skipped, missed, duplicated, timer)
+
+def report(args, wall, day_walls, fake_bot, tick_durations, loop_delays, skipped, missed, duplicated, timer):
+    print(f"Simulated {args.days} day(s), {args.users} users, latency {args.latency_ms}±{args.jitter_ms} ms")
+    print(f"Wall time: {wall:.1f} s; per simulated day: first {day_walls[0]:.1f} s, "
+          f"last {day_walls[-1]:.1f} s, avg {wall / len(day_walls):.1f} s")
+    print("  (wall time is the bot's own DB work; growth from first to last day means queries scale with table size)")
+    print("Loop model: DB/Python time of both jobs is serialized on one event loop, send latency overlaps;")
+    print("  interleaving of two runs within a tick is approximated by delaying the later start.")
+    print()
+    for job in (MORNING_JOB, EVENING_JOB):
+        durations = tick_durations[job]
+        print(f"[{job}] ticks run: {len(durations)}, skipped (previous run still busy): {skipped[job]}")
+        print(f"  tick duration p50={percentile(durations, 0.5):.3f}s p95={percentile(durations, 0.95):.3f}s "
+              f"p99={percentile(durations, 0.99):.3f}s max={max(durations, default=0):.3f}s")
+        delays = loop_delays[job]
+        print(f"  start delayed >= 1 s by the other job: {sum(1 for d in delays if d >= 1)} times, max {max(delays, default=0):.3f}s")
+        print(f"  missed reminders: {missed[job]}, duplicated: {duplicated[job]}, "
+              f"sends to blocked chats: {fake_bot.blocked_attempts[job]}")
+        busiest = sorted(((m, n) for (j, m), n in fake_bot.per_minute.items() if j == job),
+                         key=lambda item: item[1], reverse=True)[:args.top_minutes]
+        print("  busiest minutes by actual send time (recipients per day):")
+        for minute, n in busiest:
+            print(f"    {minute}  {n / args.days:.0f}")
+    print()
+    print(f"DB time: {sum(timer.total.values()):.2f} s")
+    for name, total in timer.total.most_common():
+        print(f"  {name}: {total:.2f} s over {timer.calls[name]} calls ({total / timer.calls[name] * 1000:.3f} ms avg)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Симуляция напоминаний на виртуальных часах")
+    parser.add_argument("--users", type=int, default=50000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--cluster-share", type=float, default=0.8, help="доля пользователей ровно на 08:00 / 21:00")
+    parser.add_argument("--checkin-rate", type=float, default=0.6, help="доля пользователей, отмечающихся днём")
+    parser.add_argument("--blocked-share", type=float, default=0.0, help="доля пользователей, заблокировавших бота")
+    parser.add_argument("--latency-ms", type=float, default=35.0, help="средняя задержка send_message")
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--top-minutes", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", help="путь к БД симуляции (по умолчанию временный файл)")
+    args = parser.parse_args()
+    asyncio.run(simulate(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import contextvars
+import functools
+import time
+from config import PROFILE_MAX_TRACES
+
+# Пока сбор выключен, все хуки проверяют только этот флаг.
+# Модуль без зависимостей от aiogram: его импортирует db.py.
+_active = False
+_traces = []
+_dropped = 0
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+def is_active() -> bool:
+    return _active
+
+def enable():
+    global _active, _traces, _dropped
+    _traces = []
+    _dropped = 0
+    _active = True
+
+def disable():
+    """Выключает сбор и возвращает (трассировки, число отброшенных из-за лимита)."""
+    global _active, _traces
+    _active = False
+    traces, _traces = _traces, []
+    return traces, _dropped
+
+def open_trace(kind: str, ident):
+    global _dropped
+    if len(_traces) >= PROFILE_MAX_TRACES:
+        _dropped += 1
+        return None, None
+    trace = {"kind": kind, "id": ident, "handler": None, "started": time.time(), "duration_ms": None, "calls": []}
+    _traces.append(trace)
+    return trace, _current_trace.set(trace)
+
+def close_trace(trace: dict, token, t0: float):
+    trace["duration_ms"] = round((time.perf_counter() - t0) * 1000, 3)
+    _current_trace.reset(token)
+
+def current_trace():
+    return _current_trace.get()
+
+def record_call(call_type: str, name: str, t0: float, ok: bool):
+    trace = _current_trace.get()
+    if trace is None:
+        return
+    trace["calls"].append({
+        "type": call_type,
+        "name": name,
+        "ms": round((time.perf_counter() - t0) * 1000, 3),
+        "ok": ok,
+    })
+
+def traced(fn):
+    """Декоратор для функций db.py: время каждого вызова попадает в текущую трассировку."""
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not _active:
+            return fn(*args, **kwargs)
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            result = fn(*args, **kwargs)
+            ok = True
+            return result
+        finally:
+            record_call("db", name, t0, ok)
+
+    return wrapper
+
+def traced_job(fn):
+    """Декоратор для задач планировщика: каждый запуск — отдельная трассировка."""
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        if not _active:
+            return await fn(*args, **kwargs)
+        trace, token = open_trace("job", name)
+        if trace is None:
+            return await fn(*args, **kwargs)
+        trace["handler"] = name
+        t0 = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            close_trace(trace, token, t0)
+
+    return wrapper